@@ -3,13 +3,14 @@ Merge CSV to SQL routes
 """
 import os
 import re
+import uuid
 import pandas as pd
 from datetime import datetime
 from flask import Blueprint, render_template, request, jsonify
 
 from app.services import (
     get_db_connection,
-    get_sqlalchemy_engine,
+    load_dataframe_infile,
     get_schemas,
     get_base_tables_status,
     create_base_table,
@@ -18,6 +19,42 @@ from app.services import (
 
 merge_bp = Blueprint('merge', __name__)
 
+# Known OHLCV column types — passing these to read_csv skips per-file
+# type inference. Prices stay float64: DECIMAL(10,4) needs up to 10
+# significant digits and float32 only carries ~7, so anything narrower
+# corrupts values on the way through. Volume uses the nullable Int64 so
+# a blank cell loads as NULL instead of failing the parse.
+OPTION_DTYPES = {
+    'StrikePrice': 'int32',
+    'ContractType': 'category',
+    'Open': 'float64',
+    'Close': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Volume': 'Int64'
+}
+STOCK_DTYPES = {
+    'Open': 'float64',
+    'Close': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Volume': 'Int64'
+}
+OPTION_DATE_COLS = ['Timestamp', 'ExpiryDate']
+STOCK_DATE_COLS = ['Timestamp']
+
+# Filename patterns, compiled once at import so repeated uploads don't
+# depend on the re module's internal pattern cache. Matched with
+# fullmatch against the basename, so no ^/$ anchoring is needed.
+_OPTION_RE = re.compile(
+    r"(?:.*_)?(?P<symbol>[a-z]+)_(?P<type>call|put)_(?P<tf>\d+\s*min)_.*\.csv",
+    re.IGNORECASE
+)
+_STOCK_RE = re.compile(
+    r"(?:.*_)?(?P<symbol>[a-z]+)_(?P<tf>\d+\s*min)\.csv",
+    re.IGNORECASE
+)
+
 
 def parse_filename(filename: str):
     """
@@ -29,19 +66,19 @@ def parse_filename(filename: str):
     Stock pattern: ib_data_<date>_<symbol>_<timeframe>.csv
     Example: ib_data_01202026_qqq_1 min.csv
     """
+    basename = os.path.basename(filename)
+
     # Try option pattern first (with call/put)
-    option_pattern = r".*_(?P<symbol>[a-zA-Z]+)_(?P<type>call|put)_(?P<tf>\d+\s*min)_.*\.csv$"
-    match = re.match(option_pattern, filename.lower())
+    match = _OPTION_RE.fullmatch(basename)
     if match:
-        result = match.groupdict()
+        result = {k: v.lower() for k, v in match.groupdict().items()}
         result['tf'] = result['tf'].replace(' ', '')  # Normalize "1 min" to "1min"
         return result
 
     # Try stock pattern (no call/put)
-    stock_pattern = r".*_(?P<symbol>[a-zA-Z]+)_(?P<tf>\d+\s*min)\.csv$"
-    match = re.match(stock_pattern, filename.lower())
+    match = _STOCK_RE.fullmatch(basename)
     if match:
-        result = match.groupdict()
+        result = {k: v.lower() for k, v in match.groupdict().items()}
         result['type'] = 'stock'  # Mark as stock type
         result['tf'] = result['tf'].replace(' ', '')  # Normalize "1 min" to "1min"
         return result
@@ -68,7 +105,11 @@ def merge_option_data():
         # Create table if it doesn't exist
         create_base_table(schema, table)
 
-        # Validate file names match selected table
+        # Validate file names match selected table. Lowercase the schema
+        # and table once here rather than once per file in the loop.
+        schema_lower = schema.lower()
+        table_lower = table.lower()
+
         for file in files:
             if file.filename == '':
                 continue
@@ -81,7 +122,7 @@ def merge_option_data():
             timeframe = parsed['tf']
 
             # Schema must start with symbol
-            if not schema.lower().startswith(f"{symbol}_"):
+            if not schema_lower.startswith(f"{symbol}_"):
                 return (
                     f"Filename `{file.filename}` implies symbol `{symbol}`, "
                     f"but selected schema is `{schema}`"
@@ -119,137 +160,102 @@ def merge_option_data():
                         f"Filename `{file.filename}` is a stock/index file, "
                         f"but selected table is `{table}` (option table)"
                     ), 400
-                table_lower = table.lower()
                 if option_type not in table_lower or timeframe not in table_lower:
                     return (
                         f"Filename `{file.filename}` implies option type `{option_type}` "
                         f"and timeframe `{timeframe}`, but selected table is `{table}`"
                     ), 400
 
-        # Merge CSV files
-        merged_data = pd.DataFrame()
-        total_rows_from_csv = 0
-
-        for file in files:
-            if file.filename == '':
-                continue
-            try:
-                df = pd.read_csv(file)
-                total_rows_from_csv += len(df)
-                merged_data = pd.concat([merged_data, df], ignore_index=True)
-            except Exception as e:
-                return f"Error reading {file.filename}: {e}", 500
-
-        # Drop duplicates within CSV files first
         if table in ('ib_stock_1min', 'ib_vix_1min'):
+            csv_dtypes, date_cols = STOCK_DTYPES, STOCK_DATE_COLS
             key_cols = ['Timestamp']
         else:
+            csv_dtypes, date_cols = OPTION_DTYPES, OPTION_DATE_COLS
             key_cols = ['StrikePrice', 'ContractType', 'ExpiryDate', 'Timestamp']
 
-        csv_dupes_count = len(merged_data) - len(merged_data.drop_duplicates(subset=key_cols))
-        merged_data.drop_duplicates(subset=key_cols, inplace=True)
-
+        # Stream each upload into a staging table in fixed-size chunks, then
+        # let the primary key do the duplicate detection with INSERT IGNORE
+        # into the target. Peak memory stays at one chunk regardless of
+        # upload size, and no existing keys are ever pulled back into Python.
         try:
-            engine = get_sqlalchemy_engine(schema)
-
-            # Get existing keys from SQL table to check for duplicates
-            conn = get_db_connection(schema)
-            with conn.cursor() as cur:
-                cur.execute(f"SELECT {', '.join(key_cols)} FROM `{table}`")
-                existing_rows = cur.fetchall()
-            conn.close()
-
-            # Helper to normalize datetime to string for comparison
-            def normalize_dt(val):
-                if val is None:
-                    return ''
-                if hasattr(val, 'strftime'):
-                    return val.strftime('%Y-%m-%d %H:%M:%S')
-                # Handle pandas Timestamp
-                s = str(val)
-                # Remove any timezone info and normalize format
-                s = s.replace('T', ' ').split('.')[0].split('+')[0]
-                return s.strip()
-
-            # Create set of existing keys for fast lookup
-            existing_keys = set()
-            for row in existing_rows:
-                if table in ('ib_stock_1min', 'ib_vix_1min'):
-                    existing_keys.add(normalize_dt(row[0]))
-                else:
-                    # (StrikePrice, ContractType, ExpiryDate, Timestamp)
-                    key = (
-                        int(row[0]),
-                        str(row[1]).strip(),
-                        normalize_dt(row[2]),
-                        normalize_dt(row[3])
-                    )
-                    existing_keys.add(key)
-
-            # Debug: print sample keys
-            print(f"[DEBUG] Existing keys count: {len(existing_keys)}")
-            if existing_keys:
-                sample = list(existing_keys)[:2]
-                print(f"[DEBUG] Sample existing keys: {sample}")
-
-            # Filter out rows that already exist in SQL
-            rows_before_filter = len(merged_data)
+            tmp_table = f"tmp_{table}_{uuid.uuid4().hex}"
             skipped_rows = []
+            total_rows_from_csv = 0
+            staged_rows = 0
+            data_cols = None
 
-            def row_exists(row):
-                if table in ('ib_stock_1min', 'ib_vix_1min'):
-                    key = normalize_dt(row['Timestamp'])
-                else:
-                    key = (
-                        int(row['StrikePrice']),
-                        str(row['ContractType']).strip(),
-                        normalize_dt(row['ExpiryDate']),
-                        normalize_dt(row['Timestamp'])
+            conn = get_db_connection(schema)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"CREATE TABLE `{tmp_table}` LIKE `{table}`")
+                conn.commit()
+
+                for file in files:
+                    if file.filename == '':
+                        continue
+                    try:
+                        # Parse straight off werkzeug's spooled upload
+                        # stream rather than through the FileStorage
+                        # wrapper's per-read indirection
+                        reader = pd.read_csv(
+                            file.stream,
+                            dtype=csv_dtypes,
+                            parse_dates=date_cols,
+                            cache_dates=True,
+                            chunksize=100_000
+                        )
+                        for chunk in reader:
+                            if data_cols is None:
+                                data_cols = list(chunk.columns)
+                            total_rows_from_csv += len(chunk)
+                            # Staging shares the target's PK, so in-file
+                            # duplicates are dropped right here
+                            staged_rows += load_dataframe_infile(
+                                schema, tmp_table, chunk,
+                                ignore_duplicates=True
+                            )
+                    except Exception as e:
+                        return f"Error reading {file.filename}: {e}", 500
+
+                csv_dupes_count = total_rows_from_csv - staged_rows
+
+                with conn.cursor() as cur:
+                    # Sample of rows the PK will reject, for the result page
+                    join_cond = ' AND '.join(
+                        f"t.`{c}` = x.`{c}`" for c in key_cols
                     )
-                return key in existing_keys
-
-            # Debug: print sample CSV keys
-            if len(merged_data) > 0:
-                sample_row = merged_data.iloc[0]
-                if table in ('ib_stock_1min', 'ib_vix_1min'):
-                    sample_key = normalize_dt(sample_row['Timestamp'])
-                else:
-                    sample_key = (
-                        int(sample_row['StrikePrice']),
-                        str(sample_row['ContractType']).strip(),
-                        normalize_dt(sample_row['ExpiryDate']),
-                        normalize_dt(sample_row['Timestamp'])
+                    cur.execute(
+                        f"SELECT t.* FROM `{tmp_table}` t "
+                        f"JOIN `{table}` x ON {join_cond} LIMIT 100"
                     )
-                print(f"[DEBUG] Sample CSV key: {sample_key}")
-                print(f"[DEBUG] Key in existing: {sample_key in existing_keys}")
-
-            # Identify duplicates and collect info
-            mask = merged_data.apply(row_exists, axis=1)
-            duplicate_rows = merged_data[mask]
-
-            for _, row in duplicate_rows.iterrows():
-                skipped_rows.append({
-                    'StrikePrice': row.get('StrikePrice', 'N/A'),
-                    'ContractType': row.get('ContractType', 'N/A'),
-                    'ExpiryDate': str(row.get('ExpiryDate', 'N/A')),
-                    'Timestamp': str(row.get('Timestamp', 'N/A'))
-                })
-
-            # Keep only new rows
-            new_data = merged_data[~mask]
-            duplicates_skipped = rows_before_filter - len(new_data)
-
-            # Insert only new data
-            rows_inserted = 0
-            if len(new_data) > 0:
-                new_data.to_sql(
-                    table,
-                    con=engine,
-                    schema=schema,
-                    if_exists='append',
-                    index=False
-                )
-                rows_inserted = len(new_data)
+                    dup_cols = [d[0] for d in cur.description]
+                    for row in cur.fetchall():
+                        rec = dict(zip(dup_cols, row))
+                        skipped_rows.append({
+                            'StrikePrice': rec.get('StrikePrice', 'N/A'),
+                            'ContractType': rec.get('ContractType', 'N/A'),
+                            'ExpiryDate': str(rec.get('ExpiryDate', 'N/A')),
+                            'Timestamp': str(rec.get('Timestamp', 'N/A'))
+                        })
+
+                    # Name the columns explicitly so the tables' generated
+                    # columns are computed rather than copied
+                    rows_inserted = 0
+                    if data_cols:
+                        col_list = ', '.join(f'`{c}`' for c in data_cols)
+                        cur.execute(
+                            f"INSERT IGNORE INTO `{table}` ({col_list}) "
+                            f"SELECT {col_list} FROM `{tmp_table}`"
+                        )
+                        rows_inserted = cur.rowcount
+                conn.commit()
+
+                duplicates_skipped = staged_rows - rows_inserted
+            finally:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS `{tmp_table}`")
+                conn.commit()
+                conn.close()
 
         except Exception as e:
             return f"Database error: {e}", 500
@@ -281,7 +287,7 @@ def merge_option_data():
                                rows_inserted=rows_inserted,
                                duplicates_skipped=duplicates_skipped,
                                csv_dupes=csv_dupes_count,
-                               skipped_rows=skipped_rows[:100])
+                               skipped_rows=skipped_rows)
 
     schemas = get_schemas()
     return render_template("merge_data.html", schemas=schemas)
@@ -1,6 +1,12 @@
 """
 Resample option data routes
 """
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from string import Template
+
 from flask import Blueprint, render_template, request, jsonify
 
 from app.services import (
@@ -10,6 +16,8 @@ from app.services import (
     create_resampled_table
 )
 
+logger = logging.getLogger(__name__)
+
 resample_bp = Blueprint('resample', __name__)
 
 # Timeframe mapping (minutes)
@@ -21,13 +29,33 @@ TIMEFRAMES = {
 }
 
 
-def execute_resample_option(schema, src_table, dest_table, tf_minutes):
-    """Execute resampling from 1min to higher timeframe for option tables"""
-    conn = get_db_connection(schema)
-    try:
-        with conn.cursor() as cur:
-            resample_sql = f"""
-            INSERT INTO `{schema}`.`{dest_table}`
+# Concurrent per-contract shards for the option resample. One executor
+# is shared by every timeframe so total shard concurrency stays at
+# _SHARD_WORKERS; together with the per-timeframe coordinator
+# connections the peak demand stays below the engine pool's
+# pool_size + max_overflow, so checkouts never hit the pool's wait
+# timeout.
+_SHARD_WORKERS = 8
+_SHARD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_SHARD_WORKERS, thread_name_prefix='resample-shard'
+)
+
+# What may appear inside a backtick-quoted schema/table identifier
+_IDENTIFIER_RE = re.compile(r'[A-Za-z0-9_]+')
+
+# Let the resample GROUP BY aggregate in memory instead of spilling to
+# an on-disk temp table at the 16MB default
+_SESSION_TUNING_SQL = (
+    "SET SESSION tmp_table_size = 536870912, "
+    "max_heap_table_size = 536870912"
+)
+
+
+# Resample statements are built once at import as string.Template
+# bodies; identifiers are validated in api_resample before they are
+# ever substituted, and row values still travel as %s parameters
+_OPTION_RESAMPLE_SQL = Template("""
+            INSERT INTO `$schema`.`$dest`
             (StrikePrice, ContractType, ExpiryDate, Timestamp, Open, Close, High, Low, Volume)
 
             WITH base AS (
@@ -41,15 +69,12 @@ def execute_resample_option(schema, src_table, dest_table, tf_minutes):
                     High,
                     Low,
                     Volume,
-                    FLOOR(
-                      TIMESTAMPDIFF(
-                        MINUTE,
-                        CONCAT(DATE(Timestamp), ' 09:30:00'),
-                        Timestamp
-                      ) / {tf_minutes}
-                    ) AS bucket_id
-                FROM `{schema}`.`{src_table}`
-                WHERE TIME(Timestamp) BETWEEN '09:30:00' AND '15:59:00'
+                    session_minute DIV $tf AS bucket_id
+                FROM `$schema`.`$src`
+                WHERE StrikePrice = %s
+                  AND ExpiryDate = %s
+                  AND Timestamp >= %s
+                  AND session_minute BETWEEN 0 AND 389
                   AND Open IS NOT NULL
                   AND Close IS NOT NULL
                   AND High IS NOT NULL
@@ -61,10 +86,9 @@ def execute_resample_option(schema, src_table, dest_table, tf_minutes):
                     StrikePrice,
                     ContractType,
                     ExpiryDate,
-                    DATE_ADD(
-                      CONCAT(DATE(Timestamp), ' 09:30:00'),
-                      INTERVAL bucket_id * {tf_minutes} MINUTE
-                    ) AS candle_ts,
+                    DATE(Timestamp)
+                      + INTERVAL (570 + bucket_id * $tf) MINUTE
+                      AS candle_ts,
                     Timestamp,
                     Open,
                     Close,
@@ -72,25 +96,40 @@ def execute_resample_option(schema, src_table, dest_table, tf_minutes):
                     Low,
                     Volume
                 FROM base
+            ),
+
+            windowed AS (
+                SELECT
+                    StrikePrice,
+                    ContractType,
+                    ExpiryDate,
+                    candle_ts,
+                    High,
+                    Low,
+                    Volume,
+                    FIRST_VALUE(Open) OVER w AS open_first,
+                    LAST_VALUE(Close) OVER (
+                      w ROWS BETWEEN UNBOUNDED PRECEDING
+                             AND UNBOUNDED FOLLOWING
+                    ) AS close_last
+                FROM bucketed
+                WINDOW w AS (
+                    PARTITION BY StrikePrice, ContractType, ExpiryDate, candle_ts
+                    ORDER BY Timestamp
+                )
             )
 
-            SELECT
+            SELECT SQL_BIG_RESULT
                 StrikePrice,
                 ContractType,
                 ExpiryDate,
                 candle_ts AS Timestamp,
-                SUBSTRING_INDEX(
-                  GROUP_CONCAT(Open ORDER BY Timestamp),
-                  ',', 1
-                ) AS Open,
-                SUBSTRING_INDEX(
-                  GROUP_CONCAT(Close ORDER BY Timestamp DESC),
-                  ',', 1
-                ) AS Close,
+                MIN(open_first) AS Open,
+                MIN(close_last) AS Close,
                 MAX(High) AS High,
                 MIN(Low) AS Low,
                 SUM(Volume) AS Volume
-            FROM bucketed
+            FROM windowed
             GROUP BY
                 StrikePrice,
                 ContractType,
@@ -101,24 +140,16 @@ def execute_resample_option(schema, src_table, dest_table, tf_minutes):
                 ContractType,
                 ExpiryDate,
                 candle_ts
-            """
-            cur.execute(resample_sql)
-            conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error resampling option: {e}")
-        return False
-    finally:
-        conn.close()
+            ON DUPLICATE KEY UPDATE
+                Open = VALUES(Open),
+                Close = VALUES(Close),
+                High = VALUES(High),
+                Low = VALUES(Low),
+                Volume = VALUES(Volume)
+            """)
 
-
-def execute_resample_stock(schema, src_table, dest_table, tf_minutes):
-    """Execute resampling from 1min to higher timeframe for stock/VIX tables"""
-    conn = get_db_connection(schema)
-    try:
-        with conn.cursor() as cur:
-            resample_sql = f"""
-            INSERT INTO `{schema}`.`{dest_table}`
+_STOCK_RESAMPLE_SQL = Template("""
+            INSERT INTO `$schema`.`$dest`
             (Timestamp, Open, Close, High, Low, Volume)
 
             WITH base AS (
@@ -129,15 +160,11 @@ def execute_resample_stock(schema, src_table, dest_table, tf_minutes):
                     High,
                     Low,
                     Volume,
-                    FLOOR(
-                      TIMESTAMPDIFF(
-                        MINUTE,
-                        CONCAT(DATE(Timestamp), ' 09:30:00'),
-                        Timestamp
-                      ) / {tf_minutes}
-                    ) AS bucket_id
-                FROM `{schema}`.`{src_table}`
-                WHERE TIME(Timestamp) BETWEEN '09:30:00' AND '15:59:00'
+                    session_minute DIV $tf AS bucket_id
+                FROM `$schema`.`$src`
+                WHERE Timestamp >= %s
+                  AND Timestamp < %s
+                  AND session_minute BETWEEN 0 AND 389
                   AND Open IS NOT NULL
                   AND Close IS NOT NULL
                   AND High IS NOT NULL
@@ -146,10 +173,9 @@ def execute_resample_stock(schema, src_table, dest_table, tf_minutes):
 
             bucketed AS (
                 SELECT
-                    DATE_ADD(
-                      CONCAT(DATE(Timestamp), ' 09:30:00'),
-                      INTERVAL bucket_id * {tf_minutes} MINUTE
-                    ) AS candle_ts,
+                    DATE(Timestamp)
+                      + INTERVAL (570 + bucket_id * $tf) MINUTE
+                      AS candle_ts,
                     Timestamp,
                     Open,
                     Close,
@@ -157,41 +183,183 @@ def execute_resample_stock(schema, src_table, dest_table, tf_minutes):
                     Low,
                     Volume
                 FROM base
+            ),
+
+            windowed AS (
+                SELECT
+                    candle_ts,
+                    High,
+                    Low,
+                    Volume,
+                    FIRST_VALUE(Open) OVER w AS open_first,
+                    LAST_VALUE(Close) OVER (
+                      w ROWS BETWEEN UNBOUNDED PRECEDING
+                             AND UNBOUNDED FOLLOWING
+                    ) AS close_last
+                FROM bucketed
+                WINDOW w AS (
+                    PARTITION BY candle_ts
+                    ORDER BY Timestamp
+                )
             )
 
-            SELECT
+            SELECT SQL_BIG_RESULT
                 candle_ts AS Timestamp,
-                SUBSTRING_INDEX(
-                  GROUP_CONCAT(Open ORDER BY Timestamp),
-                  ',', 1
-                ) AS Open,
-                SUBSTRING_INDEX(
-                  GROUP_CONCAT(Close ORDER BY Timestamp DESC),
-                  ',', 1
-                ) AS Close,
+                MIN(open_first) AS Open,
+                MIN(close_last) AS Close,
                 MAX(High) AS High,
                 MIN(Low) AS Low,
                 SUM(Volume) AS Volume
-            FROM bucketed
+            FROM windowed
             GROUP BY candle_ts
             ORDER BY candle_ts
-            """
-            cur.execute(resample_sql)
-            conn.commit()
+            ON DUPLICATE KEY UPDATE
+                Open = VALUES(Open),
+                Close = VALUES(Close),
+                High = VALUES(High),
+                Low = VALUES(Low),
+                Volume = VALUES(Volume)
+            """)
+
+
+def execute_resample_option(schema, src_table, dest_table, tf_minutes, conn=None):
+    """
+    Execute resampling from 1min to higher timeframe for option tables.
+
+    The source rows partition cleanly by (StrikePrice, ExpiryDate), so
+    instead of one table-wide GROUP BY the work is split into one
+    INSERT...SELECT per contract shard — each bounded by a WHERE the
+    primary key can seek on — and the shards run concurrently.
+
+    The destination is refreshed incrementally: each shard re-aggregates
+    only source rows at or after its own last materialized candle, and
+    the in-progress candle is replaced via ON DUPLICATE KEY UPDATE.
+
+    A caller-owned connection can be passed in to share the session
+    (and its warm buffer pool pages) with the preceding DDL.
+    """
+    resample_sql = _OPTION_RESAMPLE_SQL.substitute(
+        schema=schema, src=src_table, dest=dest_table, tf=tf_minutes
+    )
+
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_db_connection(schema)
+    try:
+        with conn.cursor() as cur:
+            # Per-shard watermark: a contract's candles before its own
+            # MAX(Timestamp) in the destination are already materialized,
+            # and the candle at the watermark is re-aggregated in full so
+            # a partially filled tail candle self-heals. Shards commit
+            # independently, so a table-wide watermark would let one
+            # committed shard permanently hide another shard's failed
+            # range; a shard that failed last run simply still has an old
+            # watermark here and picks up where it left off.
+            cur.execute(
+                f"SELECT s.StrikePrice, s.ExpiryDate, "
+                f"COALESCE(MAX(d.Timestamp), '1970-01-01 00:00:00') "
+                f"FROM (SELECT DISTINCT StrikePrice, ExpiryDate "
+                f"      FROM `{schema}`.`{src_table}`) s "
+                f"LEFT JOIN `{schema}`.`{dest_table}` d "
+                f"ON d.StrikePrice = s.StrikePrice "
+                f"AND d.ExpiryDate = s.ExpiryDate "
+                f"GROUP BY s.StrikePrice, s.ExpiryDate"
+            )
+            shards = cur.fetchall()
+    except Exception as e:
+        logger.error("Error listing resample shards: %s", e)
+        return False
+    finally:
+        if owns_conn:
+            conn.close()
+
+    if not shards:
+        return True
+
+    def resample_shard(shard):
+        # Acquire inside the try so a pool checkout timeout is reported
+        # as a failed shard rather than escaping through executor.map
+        shard_conn = None
+        try:
+            shard_conn = get_db_connection(schema)
+            with shard_conn.cursor() as cur:
+                cur.execute(_SESSION_TUNING_SQL)
+                # shard is (StrikePrice, ExpiryDate, watermark), matching
+                # the template's %s placeholders in order
+                cur.execute(resample_sql, shard)
+            shard_conn.commit()
+            return True
+        except Exception as e:
+            logger.error("Error resampling option shard %s: %s", shard, e)
+            return False
+        finally:
+            if shard_conn is not None:
+                shard_conn.close()
+
+    return all(_SHARD_EXECUTOR.map(resample_shard, shards))
+
+
+def execute_resample_stock(schema, src_table, dest_table, tf_minutes, conn=None):
+    """
+    Execute resampling from 1min to higher timeframe for stock/VIX tables.
+
+    Refreshes the destination incrementally from the last materialized
+    candle onward, replacing the in-progress candle via ON DUPLICATE
+    KEY UPDATE. The delta is processed one session day at a time with a
+    commit per day, so no single write transaction has to hold the
+    whole refresh in the undo/redo logs.
+
+    A caller-owned connection can be passed in to share the session
+    (and its warm buffer pool pages) with the preceding DDL.
+    """
+    resample_sql = _STOCK_RESAMPLE_SQL.substitute(
+        schema=schema, src=src_table, dest=dest_table, tf=tf_minutes
+    )
+
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_db_connection(schema)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT COALESCE(MAX(Timestamp), '1970-01-01 00:00:00') "
+                f"FROM `{schema}`.`{dest_table}`"
+            )
+            last_candle_ts = cur.fetchone()[0]
+
+            cur.execute(_SESSION_TUNING_SQL)
+            cur.execute(
+                f"SELECT DISTINCT DATE(Timestamp) "
+                f"FROM `{schema}`.`{src_table}` WHERE Timestamp >= %s",
+                (last_candle_ts,)
+            )
+            days = sorted(row[0] for row in cur.fetchall())
+
+            # One half-open day range per batch; candles already settled
+            # on the first (watermark) day are recomputed identically and
+            # replaced by the upsert
+            for day in days:
+                cur.execute(resample_sql, (day, day + timedelta(days=1)))
+                conn.commit()
         return True
     except Exception as e:
-        print(f"Error resampling stock: {e}")
+        logger.error("Error resampling stock: %s", e)
         return False
     finally:
-        conn.close()
+        if owns_conn:
+            conn.close()
+
+
+# Matches 'stock'/'vix' only as whole name segments, so e.g. a
+# hypothetical ib_stockpile_1min is not misread as a stock table
+_TABLE_TYPE_RE = re.compile(r'(?:^|_)(stock|vix)(?:_|$)', re.IGNORECASE)
 
 
 def get_table_type(src_table):
     """Determine table type from source table name"""
-    if 'stock' in src_table.lower():
-        return 'stock'
-    elif 'vix' in src_table.lower():
-        return 'vix'
+    match = _TABLE_TYPE_RE.search(src_table)
+    if match:
+        return match.group(1).lower()
     return 'option'
 
 
@@ -218,43 +386,80 @@ def api_resample():
     if not schema or not src_table or not timeframes:
         return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
 
+    # schema and table end up inside backtick-quoted identifiers, so
+    # reject anything that isn't a plain identifier before substitution
+    if not _IDENTIFIER_RE.fullmatch(schema) or not _IDENTIFIER_RE.fullmatch(src_table):
+        return jsonify({'success': False, 'error': 'Invalid schema or table name'}), 400
+
     # Determine table type
     table_type = get_table_type(src_table)
 
-    results = []
-
-    for tf_name in timeframes:
-        if tf_name not in TIMEFRAMES:
-            continue
+    def resample_one(tf_name):
+        """
+        Resample a single timeframe over one shared connection.
 
+        The destination DDL and the refresh run on the same session, so
+        each timeframe costs one pool checkout instead of one per step
+        (option contract shards still fan out over their own pooled
+        connections).
+        """
         tf_minutes = TIMEFRAMES[tf_name]
         dest_table = src_table.replace('_1min', f'_{tf_name}')
 
-        if not create_resampled_table(schema, dest_table, table_type):
-            results.append({
+        # Acquire inside the try so a pool checkout timeout (possible
+        # when several resample requests run at once) is reported as a
+        # failed timeframe rather than escaping through executor.map
+        conn = None
+        try:
+            conn = get_db_connection(schema)
+            if not create_resampled_table(schema, dest_table, table_type, conn=conn):
+                return {
+                    'timeframe': tf_name,
+                    'success': False,
+                    'error': 'Failed to create destination table'
+                }
+
+            # Use appropriate resample function based on table type
+            if table_type in ('stock', 'vix'):
+                success = execute_resample_stock(
+                    schema, src_table, dest_table, tf_minutes, conn=conn
+                )
+            else:
+                success = execute_resample_option(
+                    schema, src_table, dest_table, tf_minutes, conn=conn
+                )
+        except Exception as e:
+            logger.error("Error resampling timeframe %s: %s", tf_name, e)
+            return {
                 'timeframe': tf_name,
                 'success': False,
-                'error': 'Failed to create destination table'
-            })
-            continue
-
-        # Use appropriate resample function based on table type
-        if table_type in ('stock', 'vix'):
-            success = execute_resample_stock(schema, src_table, dest_table, tf_minutes)
-        else:
-            success = execute_resample_option(schema, src_table, dest_table, tf_minutes)
+                'error': 'Failed to execute resampling'
+            }
+        finally:
+            if conn is not None:
+                conn.close()
 
         if success:
-            results.append({
+            return {
                 'timeframe': tf_name,
                 'table': dest_table,
                 'success': True
-            })
-        else:
-            results.append({
-                'timeframe': tf_name,
-                'success': False,
-                'error': 'Failed to execute resampling'
-            })
+            }
+        return {
+            'timeframe': tf_name,
+            'success': False,
+            'error': 'Failed to execute resampling'
+        }
+
+    # Validate and normalize the requested timeframes once, before any
+    # work is dispatched: unknown names are dropped and duplicates
+    # collapse so no timeframe is resampled twice in one request
+    valid_timeframes = [tf for tf in dict.fromkeys(timeframes) if tf in TIMEFRAMES]
+
+    # Each timeframe writes to its own destination table, so run them
+    # concurrently — total latency becomes the slowest timeframe instead
+    # of the sum of all of them
+    with ThreadPoolExecutor(max_workers=max(len(valid_timeframes), 1)) as executor:
+        results = list(executor.map(resample_one, valid_timeframes))
 
     return jsonify({'success': True, 'results': results})
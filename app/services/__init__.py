@@ -1,6 +1,7 @@
 from .database import (
     get_db_connection,
     get_sqlalchemy_engine,
+    load_dataframe_infile,
     get_schemas,
     get_tables,
     get_base_tables_status,
@@ -1,12 +1,27 @@
 """
 Database connection and helper functions
 """
-import pymysql
+import functools
+import logging
+import os
+import tempfile
+import time
+
 from sqlalchemy import create_engine
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 DB_CONFIG = Config.DATABASE
 
+# Prefer mysqlclient (C extension) for row decoding; fall back to the
+# pure-Python pymysql driver when it isn't installed
+try:
+    import MySQLdb  # noqa: F401
+    MYSQL_DIALECT = 'mysql+mysqldb'
+except ImportError:
+    MYSQL_DIALECT = 'mysql+pymysql'
+
 # Base tables that should exist in each schema
 BASE_TABLES = {
     'ib_2w_call_1min': {
@@ -28,48 +43,144 @@ BASE_TABLES = {
 }
 
 
-def get_db_connection(schema=None):
-    """Get a PyMySQL connection"""
+@functools.lru_cache(maxsize=None)
+def _get_engine(schema=None):
+    """
+    Cached per-schema SQLAlchemy engine.
+
+    Each engine owns a QueuePool, so connections are reused across
+    requests instead of paying a TCP + auth handshake on every helper
+    call. pool_pre_ping revalidates idle connections before handing
+    them out.
+    """
     config = DB_CONFIG.copy()
-    if schema:
-        config['database'] = schema
-    return pymysql.connect(**config)
+    database = f"/{schema}" if schema else ""
+
+    # Compressed protocol halves wire bytes for repetitive OHLCV result
+    # sets; pymysql doesn't implement it, so only pass it to mysqlclient
+    connect_args = {}
+    if MYSQL_DIALECT == 'mysql+mysqldb':
+        connect_args['compress'] = True
+
+    return create_engine(
+        f"{MYSQL_DIALECT}://{config['user']}:{config['password']}@"
+        f"{config['host']}:{config.get('port', 3306)}{database}"
+        f"?charset=utf8mb4&local_infile=1",
+        pool_pre_ping=True,
+        pool_size=8,
+        max_overflow=8,
+        pool_recycle=3600,
+        connect_args=connect_args
+    )
+
+
+def get_db_connection(schema=None):
+    """Get a pooled DBAPI connection; close() returns it to the pool"""
+    return _get_engine(schema).raw_connection()
 
 
 def get_sqlalchemy_engine(schema):
     """Get a SQLAlchemy engine for pandas operations"""
-    config = DB_CONFIG.copy()
-    return create_engine(
-        f"mysql+pymysql://{config['user']}:{config['password']}@"
-        f"{config['host']}:{config.get('port', 3306)}/{schema}"
+    return _get_engine(schema)
+
+
+def load_dataframe_infile(schema, table, df, ignore_duplicates=False):
+    """
+    Bulk-load a DataFrame via MySQL's native LOAD DATA LOCAL INFILE.
+
+    Spills the frame to a temporary CSV and hands it to the server's
+    bulk loader, which bypasses per-row statement parsing entirely —
+    the fastest ingest path MySQL offers. With ignore_duplicates, rows
+    that collide with the table's primary key are skipped rather than
+    aborting the load. Returns the number of rows loaded.
+    """
+    if len(df) == 0:
+        return 0
+
+    ignore_kw = 'IGNORE ' if ignore_duplicates else ''
+    col_list = ', '.join(f'`{c}`' for c in df.columns)
+
+    tmp = tempfile.NamedTemporaryFile(
+        mode='w', suffix='.csv', delete=False, newline=''
     )
+    try:
+        df.to_csv(tmp, index=False, na_rep='\\N')
+        tmp.close()
+
+        conn = get_db_connection(schema)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    LOAD DATA LOCAL INFILE %s
+                    {ignore_kw}INTO TABLE `{table}`
+                    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+                    LINES TERMINATED BY '\n'
+                    IGNORE 1 LINES
+                    ({col_list})
+                    """,
+                    (tmp.name,)
+                )
+                rows_loaded = cur.rowcount
+            conn.commit()
+            return rows_loaded
+        finally:
+            conn.close()
+    finally:
+        os.unlink(tmp.name)
+
+
+# Schema/table listings change on human timescales, so cache them
+# briefly instead of paying a SHOW DATABASES/TABLES round-trip on every
+# UI request. Writes that create tables clear the cache.
+_METADATA_TTL_SECONDS = 30
+_metadata_cache = {}
+
+
+def invalidate_metadata_cache():
+    """Drop cached schema/table listings after DDL changes"""
+    _metadata_cache.clear()
+
+
+def _cached_metadata(key, fetch):
+    now = time.monotonic()
+    hit = _metadata_cache.get(key)
+    if hit is not None and now - hit[0] < _METADATA_TTL_SECONDS:
+        return hit[1]
+    value = fetch()
+    _metadata_cache[key] = (now, value)
+    return value
 
 
 def get_schemas():
     """Get list of user databases (excluding system databases)"""
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SHOW DATABASES")
-            schemas = [
-                row[0] for row in cur.fetchall()
-                if row[0] not in ('information_schema', 'mysql', 'performance_schema', 'sys')
-            ]
-        return schemas
-    finally:
-        conn.close()
+    def fetch():
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SHOW DATABASES")
+                return [
+                    row[0] for row in cur.fetchall()
+                    if row[0] not in ('information_schema', 'mysql', 'performance_schema', 'sys')
+                ]
+        finally:
+            conn.close()
+
+    return _cached_metadata('schemas', fetch)
 
 
 def get_tables(schema, pattern='_1min'):
     """Get tables in a schema matching a pattern"""
-    conn = get_db_connection(schema)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SHOW TABLES")
-            tables = [row[0] for row in cur.fetchall() if pattern in row[0]]
-        return tables
-    finally:
-        conn.close()
+    def fetch():
+        conn = get_db_connection(schema)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SHOW TABLES")
+                return [row[0] for row in cur.fetchall() if pattern in row[0]]
+        finally:
+            conn.close()
+
+    return _cached_metadata(('tables', schema, pattern), fetch)
 
 
 def get_base_tables_status(schema):
@@ -85,6 +196,20 @@ def get_base_tables_status(schema):
     return status
 
 
+# Yearly RANGE partitions for the 1min base tables. The resample's
+# watermark predicate (Timestamp >= ...) prunes to the partitions that
+# actually hold new rows instead of scanning all history. pmax catches
+# everything past the last named year.
+_PARTITION_CLAUSE = (
+    "PARTITION BY RANGE (TO_DAYS(Timestamp)) (\n"
+    + ",\n".join(
+        f"    PARTITION p{year} VALUES LESS THAN (TO_DAYS('{year + 1}-01-01'))"
+        for year in range(2020, 2031)
+    )
+    + ",\n    PARTITION pmax VALUES LESS THAN MAXVALUE\n)"
+)
+
+
 def create_base_table(schema, table_name):
     """Create a base table with the standard schema"""
     conn = get_db_connection(schema)
@@ -100,8 +225,17 @@ def create_base_table(schema, table_name):
                     High DECIMAL(10,4),
                     Low DECIMAL(10,4),
                     Volume BIGINT,
-                    PRIMARY KEY (Timestamp)
+                    session_minute INT GENERATED ALWAYS AS (
+                        TIMESTAMPDIFF(
+                            MINUTE,
+                            CONCAT(DATE(Timestamp), ' 09:30:00'),
+                            Timestamp
+                        )
+                    ) STORED,
+                    PRIMARY KEY (Timestamp),
+                    KEY idx_session_minute (session_minute)
                 )
+                {_PARTITION_CLAUSE}
                 """
             else:
                 # Options table schema
@@ -116,29 +250,48 @@ def create_base_table(schema, table_name):
                     High DECIMAL(10,4),
                     Low DECIMAL(10,4),
                     Volume BIGINT,
-                    PRIMARY KEY (StrikePrice, ContractType, ExpiryDate, Timestamp)
+                    session_minute INT GENERATED ALWAYS AS (
+                        TIMESTAMPDIFF(
+                            MINUTE,
+                            CONCAT(DATE(Timestamp), ' 09:30:00'),
+                            Timestamp
+                        )
+                    ) STORED,
+                    PRIMARY KEY (StrikePrice, ContractType, ExpiryDate, Timestamp),
+                    KEY idx_timestamp (Timestamp),
+                    KEY idx_session_minute (session_minute, StrikePrice, ContractType, ExpiryDate)
                 )
+                {_PARTITION_CLAUSE}
                 """
             cur.execute(create_sql)
             conn.commit()
+        invalidate_metadata_cache()
         return True
     except Exception as e:
-        print(f"Error creating table: {e}")
+        logger.error("Error creating table: %s", e)
         return False
     finally:
         conn.close()
 
 
-def create_resampled_table(schema, dest_table, table_type='option'):
-    """Create destination table for resampled data"""
-    conn = get_db_connection(schema)
+def create_resampled_table(schema, dest_table, table_type='option', conn=None):
+    """
+    Create destination table for resampled data if it doesn't exist.
+
+    The table is kept across calls so resampling can refresh it
+    incrementally instead of dropping and re-aggregating all history.
+    A caller-owned connection can be passed in so the DDL shares a
+    session with the refresh that follows it.
+    """
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_db_connection(schema)
     try:
         with conn.cursor() as cur:
-            cur.execute(f"DROP TABLE IF EXISTS `{schema}`.`{dest_table}`")
             if table_type in ('stock', 'vix'):
                 # Stock/VIX table schema (simpler)
                 create_sql = f"""
-                CREATE TABLE `{schema}`.`{dest_table}` (
+                CREATE TABLE IF NOT EXISTS `{schema}`.`{dest_table}` (
                     Timestamp DATETIME NOT NULL,
                     Open DECIMAL(10,4),
                     Close DECIMAL(10,4),
@@ -151,7 +304,7 @@ def create_resampled_table(schema, dest_table, table_type='option'):
             else:
                 # Option table schema
                 create_sql = f"""
-                CREATE TABLE `{schema}`.`{dest_table}` (
+                CREATE TABLE IF NOT EXISTS `{schema}`.`{dest_table}` (
                     StrikePrice INT NOT NULL,
                     ContractType VARCHAR(10) NOT NULL,
                     ExpiryDate DATETIME NOT NULL,
@@ -166,9 +319,11 @@ def create_resampled_table(schema, dest_table, table_type='option'):
                 """
             cur.execute(create_sql)
             conn.commit()
+        invalidate_metadata_cache()
         return True
     except Exception as e:
-        print(f"Error creating table: {e}")
+        logger.error("Error creating table: %s", e)
         return False
     finally:
-        conn.close()
+        if owns_conn:
+            conn.close()
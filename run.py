@@ -1,5 +1,13 @@
 """
 SQL Data Transform Service - Main entry point
+
+Run under a preforked WSGI server in production so concurrent merge and
+resample requests don't serialize behind a single worker:
+
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5001 run:app
+
+Invoking this module directly starts the Werkzeug dev server (threaded,
+for local development only).
 """
 from flask import Flask, render_template
 
@@ -20,4 +28,4 @@ def index():
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
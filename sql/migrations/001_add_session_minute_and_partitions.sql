@@ -0,0 +1,121 @@
+-- Brings 1min base tables created before the session_minute column and
+-- yearly partitioning up to the DDL in app/services/database.py. The
+-- resample templates read session_minute, so resampling fails with
+-- "Unknown column 'session_minute'" until this has been applied.
+--
+-- Run once per symbol schema:
+--
+--     mysql <schema> < sql/migrations/001_add_session_minute_and_partitions.sql
+--
+-- Tables created by the current code already match and must be skipped.
+-- Each statement rebuilds its table, so run during a quiet window.
+
+-- Option tables -------------------------------------------------------
+
+ALTER TABLE ib_2w_call_1min
+    ADD COLUMN session_minute INT GENERATED ALWAYS AS (
+        TIMESTAMPDIFF(
+            MINUTE,
+            CONCAT(DATE(Timestamp), ' 09:30:00'),
+            Timestamp
+        )
+    ) STORED,
+    ADD KEY idx_timestamp (Timestamp),
+    ADD KEY idx_session_minute (session_minute, StrikePrice, ContractType, ExpiryDate);
+
+ALTER TABLE ib_2w_call_1min
+    PARTITION BY RANGE (TO_DAYS(Timestamp)) (
+        PARTITION p2020 VALUES LESS THAN (TO_DAYS('2021-01-01')),
+        PARTITION p2021 VALUES LESS THAN (TO_DAYS('2022-01-01')),
+        PARTITION p2022 VALUES LESS THAN (TO_DAYS('2023-01-01')),
+        PARTITION p2023 VALUES LESS THAN (TO_DAYS('2024-01-01')),
+        PARTITION p2024 VALUES LESS THAN (TO_DAYS('2025-01-01')),
+        PARTITION p2025 VALUES LESS THAN (TO_DAYS('2026-01-01')),
+        PARTITION p2026 VALUES LESS THAN (TO_DAYS('2027-01-01')),
+        PARTITION p2027 VALUES LESS THAN (TO_DAYS('2028-01-01')),
+        PARTITION p2028 VALUES LESS THAN (TO_DAYS('2029-01-01')),
+        PARTITION p2029 VALUES LESS THAN (TO_DAYS('2030-01-01')),
+        PARTITION p2030 VALUES LESS THAN (TO_DAYS('2031-01-01')),
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+ALTER TABLE ib_2w_put_1min
+    ADD COLUMN session_minute INT GENERATED ALWAYS AS (
+        TIMESTAMPDIFF(
+            MINUTE,
+            CONCAT(DATE(Timestamp), ' 09:30:00'),
+            Timestamp
+        )
+    ) STORED,
+    ADD KEY idx_timestamp (Timestamp),
+    ADD KEY idx_session_minute (session_minute, StrikePrice, ContractType, ExpiryDate);
+
+ALTER TABLE ib_2w_put_1min
+    PARTITION BY RANGE (TO_DAYS(Timestamp)) (
+        PARTITION p2020 VALUES LESS THAN (TO_DAYS('2021-01-01')),
+        PARTITION p2021 VALUES LESS THAN (TO_DAYS('2022-01-01')),
+        PARTITION p2022 VALUES LESS THAN (TO_DAYS('2023-01-01')),
+        PARTITION p2023 VALUES LESS THAN (TO_DAYS('2024-01-01')),
+        PARTITION p2024 VALUES LESS THAN (TO_DAYS('2025-01-01')),
+        PARTITION p2025 VALUES LESS THAN (TO_DAYS('2026-01-01')),
+        PARTITION p2026 VALUES LESS THAN (TO_DAYS('2027-01-01')),
+        PARTITION p2027 VALUES LESS THAN (TO_DAYS('2028-01-01')),
+        PARTITION p2028 VALUES LESS THAN (TO_DAYS('2029-01-01')),
+        PARTITION p2029 VALUES LESS THAN (TO_DAYS('2030-01-01')),
+        PARTITION p2030 VALUES LESS THAN (TO_DAYS('2031-01-01')),
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+-- Stock/VIX tables ----------------------------------------------------
+
+ALTER TABLE ib_stock_1min
+    ADD COLUMN session_minute INT GENERATED ALWAYS AS (
+        TIMESTAMPDIFF(
+            MINUTE,
+            CONCAT(DATE(Timestamp), ' 09:30:00'),
+            Timestamp
+        )
+    ) STORED,
+    ADD KEY idx_session_minute (session_minute);
+
+ALTER TABLE ib_stock_1min
+    PARTITION BY RANGE (TO_DAYS(Timestamp)) (
+        PARTITION p2020 VALUES LESS THAN (TO_DAYS('2021-01-01')),
+        PARTITION p2021 VALUES LESS THAN (TO_DAYS('2022-01-01')),
+        PARTITION p2022 VALUES LESS THAN (TO_DAYS('2023-01-01')),
+        PARTITION p2023 VALUES LESS THAN (TO_DAYS('2024-01-01')),
+        PARTITION p2024 VALUES LESS THAN (TO_DAYS('2025-01-01')),
+        PARTITION p2025 VALUES LESS THAN (TO_DAYS('2026-01-01')),
+        PARTITION p2026 VALUES LESS THAN (TO_DAYS('2027-01-01')),
+        PARTITION p2027 VALUES LESS THAN (TO_DAYS('2028-01-01')),
+        PARTITION p2028 VALUES LESS THAN (TO_DAYS('2029-01-01')),
+        PARTITION p2029 VALUES LESS THAN (TO_DAYS('2030-01-01')),
+        PARTITION p2030 VALUES LESS THAN (TO_DAYS('2031-01-01')),
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+ALTER TABLE ib_vix_1min
+    ADD COLUMN session_minute INT GENERATED ALWAYS AS (
+        TIMESTAMPDIFF(
+            MINUTE,
+            CONCAT(DATE(Timestamp), ' 09:30:00'),
+            Timestamp
+        )
+    ) STORED,
+    ADD KEY idx_session_minute (session_minute);
+
+ALTER TABLE ib_vix_1min
+    PARTITION BY RANGE (TO_DAYS(Timestamp)) (
+        PARTITION p2020 VALUES LESS THAN (TO_DAYS('2021-01-01')),
+        PARTITION p2021 VALUES LESS THAN (TO_DAYS('2022-01-01')),
+        PARTITION p2022 VALUES LESS THAN (TO_DAYS('2023-01-01')),
+        PARTITION p2023 VALUES LESS THAN (TO_DAYS('2024-01-01')),
+        PARTITION p2024 VALUES LESS THAN (TO_DAYS('2025-01-01')),
+        PARTITION p2025 VALUES LESS THAN (TO_DAYS('2026-01-01')),
+        PARTITION p2026 VALUES LESS THAN (TO_DAYS('2027-01-01')),
+        PARTITION p2027 VALUES LESS THAN (TO_DAYS('2028-01-01')),
+        PARTITION p2028 VALUES LESS THAN (TO_DAYS('2029-01-01')),
+        PARTITION p2029 VALUES LESS THAN (TO_DAYS('2030-01-01')),
+        PARTITION p2030 VALUES LESS THAN (TO_DAYS('2031-01-01')),
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );